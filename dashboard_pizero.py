@@ -4,11 +4,13 @@ Lightweight DNS Analytics Dashboard for Pi Zero 2W
 Optimized for minimal memory and CPU usage
 """
 
-from flask import Flask, render_template, jsonify
+from flask import Flask, render_template, jsonify, request
 import sqlite3
 import yaml
 from datetime import datetime, timedelta
-from functools import lru_cache
+from functools import lru_cache, wraps
+import hashlib
+import json
 import time
 
 app = Flask(__name__)
@@ -19,31 +21,61 @@ CACHE_TIMEOUT = 10  # Cache results for 10 seconds
 MAX_RECENT_QUERIES = 50  # Show only 50 recent queries (vs 100)
 STATS_INTERVAL = 3600  # Update stats hourly
 
-# Simple in-memory cache
-cache = {}
-cache_times = {}
+# Single long-lived read-only connection, opened on first use
+_conn = None
 
 def get_db():
-    """Get database connection with optimizations"""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    # Read-only optimizations
-    conn.execute("PRAGMA query_only = ON")
-    conn.execute("PRAGMA cache_size = -1000")  # 1MB cache
-    return conn
+    """Get the shared read-only database connection"""
+    global _conn
+    if _conn is None:
+        conn = sqlite3.connect(
+            f"file:{DB_PATH}?mode=ro",
+            uri=True,
+            check_same_thread=False  # Shared by Flask's request threads
+        )
+        conn.row_factory = sqlite3.Row
+        # Read-only optimizations, applied once instead of per request
+        conn.execute("PRAGMA query_only = ON")
+        conn.execute("PRAGMA cache_size = -2000")    # 2MB cache
+        conn.execute("PRAGMA mmap_size = 67108864")  # 64MB memory map
+        _conn = conn
+    return _conn
+
+# Cached endpoints by key, and their (JSON bytes, ETag) per (key, time bucket).
+# A new bucket starts every ttl seconds, so stale entries simply stop being
+# asked for and age out of the LRU.
+_query_funcs = {}
+
+@lru_cache(maxsize=32)
+def _cached_json(key, bucket):
+    """Run a cached endpoint's query and serialize the result once"""
+    result = _query_funcs[key]()
+    # Endpoints that build their JSON in SQLite return it as text already
+    if not isinstance(result, str):
+        result = json.dumps(result, separators=(',', ':'))
+    body = result.encode()
+    return body, hashlib.blake2b(body, digest_size=8).hexdigest()
 
 def cached_query(key, ttl=CACHE_TIMEOUT):
-    """Simple cache decorator"""
+    """Cache an endpoint's JSON for ttl seconds"""
     def decorator(func):
-        def wrapper(*args, **kwargs):
+        _query_funcs[key] = func
+        
+        @wraps(func)
+        def wrapper():
             now = time.time()
-            if key in cache and (now - cache_times.get(key, 0)) < ttl:
-                return cache[key]
+            body, etag = _cached_json(key, int(now // ttl))
+            headers = {
+                'ETag': f'"{etag}"',
+                # Browser may reuse it until this bucket expires
+                'Cache-Control': f'public, max-age={ttl - int(now % ttl)}'
+            }
             
-            result = func(*args, **kwargs)
-            cache[key] = result
-            cache_times[key] = now
-            return result
+            # Unchanged since the browser's last fetch - skip the body
+            if request.if_none_match.contains(etag):
+                return app.response_class(status=304, headers=headers)
+            return app.response_class(body, mimetype='application/json',
+                                      headers=headers)
         return wrapper
     return decorator
 
@@ -62,42 +94,26 @@ def get_stats():
     # Last 24 hours stats
     yesterday = int(time.time()) - 86400
     
-    # Total queries
-    total = cursor.execute(
-        "SELECT COUNT(*) FROM dns_queries WHERE timestamp > ?",
-        (yesterday,)
-    ).fetchone()[0]
-    
-    # Blocked queries
-    blocked = cursor.execute(
-        "SELECT COUNT(*) FROM dns_queries WHERE blocked = 1 AND timestamp > ?",
-        (yesterday,)
-    ).fetchone()[0]
-    
-    # Unique domains
-    unique_domains = cursor.execute(
-        "SELECT COUNT(DISTINCT domain) FROM dns_queries WHERE timestamp > ?",
-        (yesterday,)
-    ).fetchone()[0]
-    
-    # Unique clients
-    unique_clients = cursor.execute(
-        "SELECT COUNT(DISTINCT client_ip) FROM dns_queries "
-        "WHERE client_ip IS NOT NULL AND timestamp > ?",
-        (yesterday,)
-    ).fetchone()[0]
-    
-    conn.close()
+    # Total, blocked, unique domains and unique clients in one pass
+    total, blocked, unique_domains, unique_clients = cursor.execute("""
+        SELECT
+            COUNT(*),
+            COALESCE(SUM(blocked), 0),
+            COUNT(DISTINCT domain_id),
+            COUNT(DISTINCT client_ip)
+        FROM dns_queries
+        WHERE timestamp > ?
+    """, (yesterday,)).fetchone()
     
     blocked_pct = (blocked / total * 100) if total > 0 else 0
     
-    return jsonify({
+    return {
         'total_queries': total,
         'blocked_queries': blocked,
         'blocked_percentage': round(blocked_pct, 1),
         'unique_domains': unique_domains,
         'unique_clients': unique_clients
-    })
+    }
 
 @app.route('/api/top-domains')
 @cached_query('top_domains', ttl=60)  # Cache for 1 minute
@@ -108,21 +124,22 @@ def get_top_domains():
     
     yesterday = int(time.time()) - 86400
     
-    rows = cursor.execute("""
-        SELECT domain, COUNT(*) as count
-        FROM dns_queries
-        WHERE timestamp > ? AND blocked = 0
-        GROUP BY domain
-        ORDER BY count DESC
-        LIMIT 10
-    """, (yesterday,)).fetchall()
-    
-    conn.close()
-    
-    return jsonify([{
-        'domain': row['domain'],
-        'count': row['count']
-    } for row in rows])
+    return cursor.execute("""
+        SELECT json_group_array(json_object('domain', name, 'count', count))
+        FROM (
+            SELECT d.name, t.count
+            FROM (
+                SELECT domain_id, COUNT(*) as count
+                FROM dns_queries
+                WHERE timestamp > ? AND blocked = 0
+                GROUP BY domain_id
+                ORDER BY count DESC
+                LIMIT 10
+            ) t
+            JOIN domains d ON d.id = t.domain_id
+            ORDER BY t.count DESC
+        )
+    """, (yesterday,)).fetchone()[0]
 
 @app.route('/api/top-blocked')
 @cached_query('top_blocked', ttl=60)
@@ -133,21 +150,22 @@ def get_top_blocked():
     
     yesterday = int(time.time()) - 86400
     
-    rows = cursor.execute("""
-        SELECT domain, COUNT(*) as count
-        FROM dns_queries
-        WHERE timestamp > ? AND blocked = 1
-        GROUP BY domain
-        ORDER BY count DESC
-        LIMIT 10
-    """, (yesterday,)).fetchall()
-    
-    conn.close()
-    
-    return jsonify([{
-        'domain': row['domain'],
-        'count': row['count']
-    } for row in rows])
+    return cursor.execute("""
+        SELECT json_group_array(json_object('domain', name, 'count', count))
+        FROM (
+            SELECT d.name, t.count
+            FROM (
+                SELECT domain_id, COUNT(*) as count
+                FROM dns_queries
+                WHERE timestamp > ? AND blocked = 1
+                GROUP BY domain_id
+                ORDER BY count DESC
+                LIMIT 10
+            ) t
+            JOIN domains d ON d.id = t.domain_id
+            ORDER BY t.count DESC
+        )
+    """, (yesterday,)).fetchone()[0]
 
 @app.route('/api/timeline')
 @cached_query('timeline', ttl=60)
@@ -158,25 +176,22 @@ def get_timeline():
     
     yesterday = int(time.time()) - 86400
     
-    # Get hourly buckets
-    rows = cursor.execute("""
-        SELECT 
-            (timestamp / 3600) * 3600 as hour,
-            COUNT(*) as total,
-            SUM(blocked) as blocked
-        FROM dns_queries
-        WHERE timestamp > ?
-        GROUP BY hour
-        ORDER BY hour
-    """, (yesterday,)).fetchall()
-    
-    conn.close()
-    
-    return jsonify([{
-        'timestamp': row['hour'],
-        'total': row['total'],
-        'blocked': row['blocked']
-    } for row in rows])
+    # Get hourly buckets, streamed in order from the hour_bucket index
+    return cursor.execute("""
+        SELECT json_group_array(json_object(
+            'timestamp', hour, 'total', total, 'blocked', blocked
+        ))
+        FROM (
+            SELECT 
+                hour_bucket * 3600 as hour,
+                COUNT(*) as total,
+                SUM(blocked) as blocked
+            FROM dns_queries
+            WHERE hour_bucket >= ? / 3600 AND timestamp > ?
+            GROUP BY hour_bucket
+            ORDER BY hour_bucket
+        )
+    """, (yesterday, yesterday)).fetchone()[0]
 
 @app.route('/api/clients')
 @cached_query('clients', ttl=60)
@@ -187,45 +202,57 @@ def get_clients():
     
     yesterday = int(time.time()) - 86400
     
-    rows = cursor.execute("""
-        SELECT client_ip, COUNT(*) as count
-        FROM dns_queries
-        WHERE client_ip IS NOT NULL AND timestamp > ?
-        GROUP BY client_ip
-        ORDER BY count DESC
-        LIMIT 10
-    """, (yesterday,)).fetchall()
-    
-    conn.close()
-    
-    return jsonify([{
-        'client': row['client_ip'],
-        'queries': row['count']
-    } for row in rows])
+    return cursor.execute("""
+        SELECT json_group_array(json_object('client', client_ip, 'queries', count))
+        FROM (
+            SELECT client_ip, COUNT(*) as count
+            FROM dns_queries
+            WHERE client_ip IS NOT NULL AND timestamp > ?
+            GROUP BY client_ip
+            ORDER BY count DESC
+            LIMIT 10
+        )
+    """, (yesterday,)).fetchone()[0]
 
 @app.route('/api/recent')
 def get_recent_queries():
-    """Recent queries - limited to 50 for performance"""
+    """Recent queries - limited to 50, ?before=<timestamp>&before_id=<id> pages back"""
     conn = get_db()
     cursor = conn.cursor()
     
-    rows = cursor.execute("""
-        SELECT timestamp, client_ip, domain, query_type, status, blocked
-        FROM dns_queries
-        ORDER BY timestamp DESC
-        LIMIT ?
-    """, (MAX_RECENT_QUERIES,)).fetchall()
-    
-    conn.close()
-    
-    return jsonify([{
-        'timestamp': row['timestamp'],
-        'client': row['client_ip'],
-        'domain': row['domain'],
-        'type': row['query_type'],
-        'status': row['status'],
-        'blocked': bool(row['blocked'])
-    } for row in rows])
+    # Keyset pagination: seek the index below the cursor instead of OFFSET;
+    # with no cursor every row qualifies and the newest come first. The id
+    # breaks ties, since many rows share one whole-second timestamp.
+    before = request.args.get('before', default=2**63 - 1, type=int)
+    before_id = request.args.get('before_id', default=2**63 - 1, type=int)
+    
+    body = cursor.execute("""
+        SELECT json_group_array(json_object(
+            'id', id,
+            'timestamp', timestamp,
+            'client', client_ip,
+            'domain', domain,
+            'type', query_type,
+            'status', CASE WHEN blocked THEN 'blocked' ELSE 'allowed' END,
+            'blocked', json(CASE WHEN blocked THEN 'true' ELSE 'false' END)
+        ))
+        FROM (
+            SELECT q.id, q.timestamp, q.client_ip, d.name as domain,
+                   qt.name as query_type, q.blocked
+            FROM (
+                SELECT id, timestamp, client_ip, domain_id, query_type_id, blocked
+                FROM dns_queries
+                WHERE (timestamp, id) < (?, ?)
+                ORDER BY timestamp DESC, id DESC
+                LIMIT ?
+            ) q
+            JOIN domains d ON d.id = q.domain_id
+            LEFT JOIN query_types qt ON qt.id = q.query_type_id
+            ORDER BY q.timestamp DESC, q.id DESC
+        )
+    """, (before, before_id, MAX_RECENT_QUERIES)).fetchone()[0]
+    
+    return app.response_class(body, mimetype='application/json')
 
 @app.route('/api/query-types')
 @cached_query('query_types', ttl=120)
@@ -236,20 +263,20 @@ def get_query_types():
     
     yesterday = int(time.time()) - 86400
     
-    rows = cursor.execute("""
-        SELECT query_type, COUNT(*) as count
-        FROM dns_queries
-        WHERE query_type IS NOT NULL AND timestamp > ?
-        GROUP BY query_type
-        ORDER BY count DESC
-    """, (yesterday,)).fetchall()
-    
-    conn.close()
-    
-    return jsonify([{
-        'type': row['query_type'],
-        'count': row['count']
-    } for row in rows])
+    return cursor.execute("""
+        SELECT json_group_array(json_object('type', name, 'count', count))
+        FROM (
+            SELECT qt.name, t.count
+            FROM (
+                SELECT query_type_id, COUNT(*) as count
+                FROM dns_queries
+                WHERE query_type_id IS NOT NULL AND timestamp > ?
+                GROUP BY query_type_id
+            ) t
+            JOIN query_types qt ON qt.id = t.query_type_id
+            ORDER BY t.count DESC
+        )
+    """, (yesterday,)).fetchone()[0]
 
 @app.route('/health')
 def health_check():
@@ -257,26 +284,6 @@ def health_check():
     try:
         conn = get_db()
         conn.execute("SELECT 1")
-        conn.close()
         return jsonify({'status': 'healthy', 'timestamp': int(time.time())})
     except Exception as e:
         return jsonify({'status': 'unhealthy', 'error': str(e)}), 500
-
-if __name__ == '__main__':
-    print("=" * 60)
-    print("🚀 Pi-hole Dashboard - Pi Zero 2W Edition")
-    print("=" * 60)
-    print(f"💾 Database: {DB_PATH}")
-    print(f"⚡ Cache: {CACHE_TIMEOUT}s TTL")
-    print(f"📊 Recent queries: {MAX_RECENT_QUERIES}")
-    print("🌐 Starting server on http://0.0.0.0:5000")
-    print("=" * 60)
-    
-    # Run with minimal threads for Pi Zero 2W
-    app.run(
-        host='0.0.0.0',
-        port=5000,
-        debug=False,
-        threaded=True,
-        processes=1  # Single process for low memory
-    )
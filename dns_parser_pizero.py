@@ -11,23 +11,91 @@ Key Optimizations:
 - Graceful shutdown with data preservation
 """
 
-import re
+import os
+import queue
 import sqlite3
 import time
 import signal
 import sys
+import threading
 import yaml
-from datetime import datetime
 from pathlib import Path
-from collections import deque
+from collections import OrderedDict
+
+try:
+    import inotify_simple
+except ImportError:  # Optional: fall back to polling the log
+    inotify_simple = None
 
 # Pi Zero 2W Tuning Parameters
 BATCH_SIZE = 50              # Write every 50 queries
 BATCH_INTERVAL = 30          # Or every 30 seconds (whichever comes first)
-BUFFER_MAX = 100             # Max queries in memory before force flush
+BUFFER_MAX = 100             # Max queries queued for the writer thread
 DB_CACHE_SIZE = 2000         # SQLite page cache in KB (2MB)
-POLL_INTERVAL = 0.5          # Log check interval (seconds)
+POLL_INTERVAL = 0.5          # Log check interval without inotify (seconds)
 RETENTION_DAYS = 30          # Keep logs for 30 days (vs 90 on Pi 4)
+DOMAIN_CACHE_MAX = 4096      # Hot domain name -> id mappings kept in memory
+MAINTENANCE_INTERVAL = 86400 # Cleanup + planner stats refresh every 24h
+VACUUM_PAGES = 1000          # Free pages returned to the filesystem per cleanup
+CLEANUP_CHUNK = 500          # Old rows deleted per write transaction
+READ_CHUNK = 1 << 20         # Max bytes of new log read and decoded at once
+
+# Wake on new log lines, and on rotation (file renamed or removed)
+LOG_WATCH_FLAGS = (
+    inotify_simple.flags.MODIFY | inotify_simple.flags.MOVE_SELF |
+    inotify_simple.flags.DELETE_SELF
+) if inotify_simple else 0
+
+# Log line markers located with str.find - no regex engine in the hot path
+QUERY_MARKER = ' query['
+BLOCKED_MARKERS = (' gravity blocked ', ' config blocked ')
+
+# Syslog month abbreviations, for parsing timestamps without strptime
+MONTHS = {
+    'Jan': 1, 'Feb': 2, 'Mar': 3, 'Apr': 4, 'May': 5, 'Jun': 6,
+    'Jul': 7, 'Aug': 8, 'Sep': 9, 'Oct': 10, 'Nov': 11, 'Dec': 12
+}
+
+# Query types stored as small integers; anything unlisted is 0 ("OTHER").
+# Seeded into the query_types table, which the dashboard joins for names.
+QTYPE = {
+    'A': 1, 'AAAA': 2, 'PTR': 3, 'HTTPS': 4, 'TXT': 5, 'CNAME': 6,
+    'MX': 7, 'SRV': 8, 'SOA': 9, 'NS': 10, 'SVCB': 11, 'ANY': 12
+}
+QTYPE_OTHER = 0
+
+# Column order of the row tuples returned by parse_query. The domain slot
+# holds the name until flush_buffer swaps in its domains.id. Status is not
+# stored: it is always derived from blocked.
+FIELDS = ('timestamp', 'client_ip', 'domain_id', 'query_type_id',
+          'blocked', 'response_time')
+DOMAIN_INDEX = FIELDS.index('domain_id')
+INSERT_PREFIX = f"INSERT INTO dns_queries ({', '.join(FIELDS)}) VALUES "
+ROW_PLACEHOLDER = f"({', '.join('?' * len(FIELDS))})"
+
+# Multi-row INSERT sizes, largest first (100 rows x 6 params stays under
+# SQLite's 999 limit). Batches are split into these fixed sizes so the SQL
+# text repeats and every flush hits sqlite3's prepared statement cache.
+INSERT_BUCKETS = (100, 50, 25, 10, 5, 1)
+INSERT_SQL = {
+    size: INSERT_PREFIX + ','.join([ROW_PLACEHOLDER] * size)
+    for size in INSERT_BUCKETS
+}
+
+# ALTER TABLE ... DROP COLUMN needs SQLite 3.35; older builds (Raspberry Pi
+# OS Bullseye ships 3.34) rebuild the table from this definition instead
+QUERIES_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS {table} (
+        id INTEGER PRIMARY KEY,
+        timestamp INTEGER NOT NULL,
+        client_ip TEXT,
+        domain_id INTEGER NOT NULL REFERENCES domains(id),
+        query_type_id INTEGER REFERENCES query_types(id),
+        blocked INTEGER DEFAULT 0,
+        response_time REAL,
+        hour_bucket INTEGER GENERATED ALWAYS AS (timestamp / 3600) VIRTUAL
+    )
+"""
 
 class OptimizedDNSParser:
     def __init__(self, config_path='config/config.yaml'):
@@ -37,18 +105,23 @@ class OptimizedDNSParser:
         self.log_path = self.config['pihole']['log_path']
         self.running = True
         
-        # Memory-efficient query buffer
-        self.buffer = deque(maxlen=BUFFER_MAX)
-        self.last_flush = time.time()
+        # Bounded hand-off from the log reader to the DB writer thread; a
+        # full queue makes the reader wait instead of growing memory
+        self.queue = queue.Queue(maxsize=BUFFER_MAX)
+        self.writer = None
+        self.log_wd = None  # inotify watch on the file currently followed
+        
+        # Writer-thread state: the batch being collected (FIELDS-ordered row
+        # tuples) and rows from a failed flush, retried next time
+        self.buffer = []
+        self.pending_rows = []
+        self.domain_ids = OrderedDict()  # LRU of domain name -> domains.id
+        self.last_maintenance = time.time()
         self.queries_processed = 0
         
-        # Optimized regex patterns
-        self.query_pattern = re.compile(
-            r'(\w{3}\s+\d{1,2}\s+\d{2}:\d{2}:\d{2}).*query\[(\w+)\]\s+(\S+)\s+from\s+(\S+)'
-        )
-        self.blocked_pattern = re.compile(
-            r'(\w{3}\s+\d{1,2}\s+\d{2}:\d{2}:\d{2}).*(?:gravity blocked|config blocked)\s+(\S+)'
-        )
+        # Last parsed timestamp - lines logged in the same second share it
+        self._last_ts_str = None
+        self._last_ts = None
         
         # Database setup with optimizations
         self.setup_database()
@@ -82,99 +155,251 @@ class OptimizedDNSParser:
         cursor = self.conn.cursor()
         
         # Pi Zero 2W specific SQLite tuning
+        # (auto_vacuum first: it only applies to a new database before WAL)
+        cursor.execute("PRAGMA auto_vacuum = INCREMENTAL")       # Reclaim space in small steps
         cursor.execute(f"PRAGMA cache_size = -{DB_CACHE_SIZE}")  # 2MB cache
         cursor.execute("PRAGMA journal_mode = WAL")              # Write-ahead logging
         cursor.execute("PRAGMA synchronous = NORMAL")            # Faster writes
         cursor.execute("PRAGMA temp_store = MEMORY")             # In-memory temp
         cursor.execute("PRAGMA mmap_size = 268435456")           # 256MB memory map
         cursor.execute("PRAGMA page_size = 4096")                # Match SD card block size
-        
+
+        # Domain names are stored once and referenced by id
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS domains (
+                id INTEGER PRIMARY KEY,
+                name TEXT UNIQUE NOT NULL
+            )
+        """)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS query_types (
+                id INTEGER PRIMARY KEY,
+                name TEXT NOT NULL
+            )
+        """)
+        cursor.executemany(
+            "INSERT OR IGNORE INTO query_types (id, name) VALUES (?, ?)",
+            [(QTYPE_OTHER, 'OTHER')] + [(i, name) for name, i in QTYPE.items()]
+        )
+        cursor.execute(QUERIES_TABLE_SQL.format(table='dns_queries'))
+
+        self.migrate_schema(cursor)
+
+        # Indexes matching the dashboard's "last 24h" filters, so every
+        # endpoint searches a B-tree range instead of scanning the table
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_ts_blocked_domain "
+                       "ON dns_queries(timestamp, blocked, domain_id)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_ts_qtype "
+                       "ON dns_queries(timestamp, query_type_id)")
+        # Hourly timeline: rows come out already grouped, no temp B-tree sort
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_hour "
+                       "ON dns_queries(hour_bucket, timestamp, blocked)")
+        # Recent queries: newest rows read straight from the index leaves.
+        # It also leads with (timestamp, client_ip), so client lookups use it.
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_recent_cover "
+                       "ON dns_queries(timestamp DESC, client_ip, domain_id, "
+                       "query_type_id, blocked)")
+
+        # Gather planner statistics once, the first time the indexes exist
+        has_stats = cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'"
+        ).fetchone()
+        if not has_stats:
+            cursor.execute("ANALYZE")
+        self.conn.commit()
+
         print("Database optimized for Pi Zero 2W")
         print(f"Cache: {DB_CACHE_SIZE}KB | WAL mode | Retention: {RETENTION_DAYS} days")
     
+    def migrate_schema(self, cursor):
+        """Bring databases created by older versions up to date in place"""
+        columns = {row[1] for row in cursor.execute(
+            "PRAGMA table_xinfo(dns_queries)"
+        )}
+        dropped = []  # Old columns removed once every step has copied them
+        
+        if 'hour_bucket' not in columns:
+            cursor.execute("ALTER TABLE dns_queries ADD COLUMN hour_bucket INTEGER "
+                           "GENERATED ALWAYS AS (timestamp / 3600) VIRTUAL")
+        
+        # auto_vacuum only changes on a rebuild; do it once so cleanup never
+        # needs a full VACUUM again
+        if cursor.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            print("🔄 Enabling incremental vacuum (one-time rebuild)...")
+            self.conn.commit()
+            cursor.execute("VACUUM")
+        
+        # Domain strings move into the domains table (one-time rewrite)
+        if 'domain' in columns:
+            print("🔄 Migrating domains to lookup table...")
+            cursor.execute("INSERT OR IGNORE INTO domains (name) "
+                           "SELECT DISTINCT domain FROM dns_queries")
+            cursor.execute("ALTER TABLE dns_queries ADD COLUMN domain_id INTEGER "
+                           "REFERENCES domains(id)")
+            cursor.execute("UPDATE dns_queries SET domain_id = "
+                           "(SELECT id FROM domains WHERE name = dns_queries.domain)")
+            dropped.append('domain')
+        
+        # Query type text becomes a query_types id; status (a copy of
+        # blocked) is dropped (one-time rewrite)
+        if 'query_type' in columns:
+            print("🔄 Encoding query types and status as integers...")
+            cursor.execute("ALTER TABLE dns_queries ADD COLUMN query_type_id INTEGER "
+                           "REFERENCES query_types(id)")
+            cursor.execute("""
+                UPDATE dns_queries SET query_type_id = COALESCE(
+                    (SELECT id FROM query_types WHERE name = dns_queries.query_type),
+                    ?
+                ) WHERE query_type IS NOT NULL
+            """, (QTYPE_OTHER,))
+            dropped += ['query_type', 'status']
+        
+        if dropped:
+            self.drop_columns(cursor, dropped)
+        
+        # Superseded by wider indexes that start with the same columns:
+        # idx_recent_cover and idx_ts_blocked_domain
+        cursor.execute("DROP INDEX IF EXISTS idx_ts_client")
+        cursor.execute("DROP INDEX IF EXISTS idx_ts_blocked")
+    
+    def drop_columns(self, cursor, names):
+        """Remove old columns from dns_queries, with any index that uses them"""
+        names = set(names)
+        indexes = {}  # Index name -> CREATE statement, for indexes that survive
+        for index in cursor.execute("PRAGMA index_list(dns_queries)").fetchall():
+            name, origin = index[1], index[3]
+            if origin != 'c':
+                continue  # Constraint indexes go with their columns
+            used = {row[2] for row in cursor.execute(f"PRAGMA index_info({name})")}
+            if used & names:
+                # DROP COLUMN refuses to run while an index covers the column
+                cursor.execute(f"DROP INDEX {name}")
+            else:
+                indexes[name] = cursor.execute(
+                    "SELECT sql FROM sqlite_master WHERE name = ?", (name,)
+                ).fetchone()[0]
+        
+        if sqlite3.sqlite_version_info >= (3, 35, 0):
+            for name in names:
+                cursor.execute(f"ALTER TABLE dns_queries DROP COLUMN {name}")
+            return
+        
+        # Older SQLite: copy the kept columns into a fresh table and swap it in
+        print(f"🔄 Rebuilding dns_queries for SQLite {sqlite3.sqlite_version}...")
+        cursor.execute("DROP TABLE IF EXISTS dns_queries_new")
+        cursor.execute(QUERIES_TABLE_SQL.format(table='dns_queries_new'))
+        new = [row[1] for row in cursor.execute("PRAGMA table_xinfo(dns_queries_new)")
+               if row[6] == 0]  # Stored columns only, not hour_bucket
+        old = {row[1] for row in cursor.execute("PRAGMA table_xinfo(dns_queries)")}
+        kept = ', '.join(name for name in new if name in old)
+        cursor.execute(f"INSERT INTO dns_queries_new ({kept}) "
+                       f"SELECT {kept} FROM dns_queries")
+        cursor.execute("DROP TABLE dns_queries")
+        cursor.execute("ALTER TABLE dns_queries_new RENAME TO dns_queries")
+        for sql in indexes.values():
+            cursor.execute(sql)
+    
     def setup_signal_handlers(self):
         """Handle graceful shutdown"""
         signal.signal(signal.SIGINT, self.shutdown)
         signal.signal(signal.SIGTERM, self.shutdown)
     
     def shutdown(self, signum, frame):
-        """Graceful shutdown with buffer flush"""
+        """Stop reading the log; monitor_log then drains and flushes"""
         print("\n🛑 Shutdown signal received...")
         self.running = False
+        sys.exit(0)
+    
+    def close(self):
+        """Drain the writer queue, flush the last batch and close the DB"""
+        # A second Ctrl+C must not interrupt the final flush
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
         
-        if self.buffer:
-            print(f"💾 Flushing {len(self.buffer)} buffered queries...")
-            self.flush_buffer()
+        # Sentinel: everything before it gets written
+        if self.writer is not None and self.enqueue(None):
+            self.writer.join()
         
         self.conn.close()
         print(f"✅ Processed {self.queries_processed} total queries")
-        sys.exit(0)
     
     def parse_timestamp(self, timestamp_str):
         """Convert syslog timestamp to epoch"""
+        if timestamp_str == self._last_ts_str:
+            return self._last_ts
+        
         try:
-            year = datetime.now().year
-            dt = datetime.strptime(f"{year} {timestamp_str}", "%Y %b %d %H:%M:%S")
-            return int(dt.timestamp())
+            month, day, clock = timestamp_str.split()
+            hour, minute, second = clock.split(':')
+            epoch = int(time.mktime((
+                time.localtime().tm_year, MONTHS[month], int(day),
+                int(hour), int(minute), int(second), 0, 0, -1
+            )))
         except Exception:
             return int(time.time())
+        
+        self._last_ts_str = timestamp_str
+        self._last_ts = epoch
+        return epoch
     
     def parse_query(self, line):
-        """Extract query data from log line"""
-        # Check for regular query
-        match = self.query_pattern.search(line)
-        if match:
-            timestamp_str, qtype, domain, client = match.groups()
-            return {
-                'timestamp': self.parse_timestamp(timestamp_str),
-                'client_ip': client,
-                'domain': domain.lower(),
-                'query_type': qtype,
-                'status': 'allowed',
-                'blocked': 0,
-                'response_time': None
-            }
-        
-        # Check for blocked query
-        match = self.blocked_pattern.search(line)
-        if match:
-            timestamp_str, domain = match.groups()
-            return {
-                'timestamp': self.parse_timestamp(timestamp_str),
-                'client_ip': None,
-                'domain': domain.lower(),
-                'query_type': None,
-                'status': 'blocked',
-                'blocked': 1,
-                'response_time': None
-            }
+        """Extract query data from log line as a FIELDS-ordered tuple"""
+        # Fixed-shape lines: "<timestamp> dnsmasq[pid]: query[A] <domain> from
+        # <client>" or "... gravity blocked <domain> is 0.0.0.0"
+        idx = line.find(QUERY_MARKER)
+        if idx != -1:
+            parts = line[idx + len(QUERY_MARKER):].split(None, 4)
+            if len(parts) >= 4 and parts[0][-1:] == ']' and parts[2] == 'from':
+                return (self.parse_timestamp(line[:15]), parts[3], parts[1].lower(),
+                        QTYPE.get(parts[0][:-1], QTYPE_OTHER), 0, None)
+        elif 'blocked' in line:
+            for marker in BLOCKED_MARKERS:
+                idx = line.find(marker)
+                if idx != -1:
+                    parts = line[idx + len(marker):].split(None, 1)
+                    if parts:
+                        return (self.parse_timestamp(line[:15]), None,
+                                parts[0].lower(), None, 1, None)
+                    break
         
         return None
     
     def flush_buffer(self):
         """Batch write queries to database"""
-        if not self.buffer:
+        if not self.buffer and not self.pending_rows:
             return
         
+        # Materialize rows once so a failed batch can be retried as-is
+        rows = self.pending_rows + list(self.buffer)
+        self.pending_rows = []
+        self.buffer.clear()
+        
         try:
             cursor = self.conn.cursor()
             
-            # Batch insert for minimal I/O
-            cursor.executemany("""
-                INSERT INTO dns_queries 
-                (timestamp, client_ip, domain, query_type, status, blocked, response_time)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            """, [
-                (q['timestamp'], q['client_ip'], q['domain'], q['query_type'],
-                 q['status'], q['blocked'], q['response_time'])
-                for q in self.buffer
-            ])
+            # Take the write lock up front so the batch never has to upgrade
+            # from a read lock halfway through
+            cursor.execute("BEGIN IMMEDIATE")
+            ids, new_ids = self.resolve_domain_ids(
+                cursor, {row[DOMAIN_INDEX] for row in rows}
+            )
             
+            # One multi-row INSERT per chunk instead of one statement per row
+            start = 0
+            while start < len(rows):
+                size = next(n for n in INSERT_BUCKETS if n <= len(rows) - start)
+                params = []
+                for row in rows[start:start + size]:
+                    params.extend(row[:DOMAIN_INDEX])
+                    params.append(ids[row[DOMAIN_INDEX]])
+                    params.extend(row[DOMAIN_INDEX + 1:])
+                cursor.execute(INSERT_SQL[size], params)
+                start += size
             self.conn.commit()
-            count = len(self.buffer)
+            self.remember_domain_ids(new_ids)
+            
+            count = len(rows)
             self.queries_processed += count
-            self.buffer.clear()
-            self.last_flush = time.time()
             
             # Show progress every 500 queries
             if self.queries_processed % 500 == 0:
@@ -183,31 +408,255 @@ class OptimizedDNSParser:
             
         except sqlite3.Error as e:
             print(f"❌ Database error: {e}")
-            # Keep buffer on error for retry
+            try:
+                if self.conn.in_transaction:
+                    self.conn.rollback()
+            except sqlite3.Error as e:
+                print(f"❌ Rollback error: {e}")
+            # Keep rows on error for retry, bounded like the buffer itself
+            self.pending_rows = rows[-BUFFER_MAX:]
     
-    def should_flush(self):
-        """Determine if buffer should be written"""
-        if len(self.buffer) >= BATCH_SIZE:
-            return True
-        if time.time() - self.last_flush >= BATCH_INTERVAL:
-            return True
-        return False
+    def resolve_domain_ids(self, cursor, names):
+        """Map domain names to ids, inserting unseen names into domains
+        
+        Returns (ids for all names, ids newly read from the database). The
+        new ids only go into the in-memory cache once the batch commits.
+        """
+        ids = {}
+        missing = []
+        for name in names:
+            domain_id = self.domain_ids.get(name)
+            if domain_id is None:
+                missing.append(name)
+            else:
+                self.domain_ids.move_to_end(name)
+                ids[name] = domain_id
+        
+        new_ids = {}
+        # A flush holds at most 2 x BUFFER_MAX names, well under 999 params
+        if missing:
+            cursor.executemany("INSERT OR IGNORE INTO domains (name) VALUES (?)",
+                               [(name,) for name in missing])
+            new_ids = dict(cursor.execute(
+                "SELECT name, id FROM domains WHERE name IN "
+                f"({','.join('?' * len(missing))})",
+                missing
+            ))
+            ids.update(new_ids)
+        return ids, new_ids
+    
+    def remember_domain_ids(self, new_ids):
+        """Add committed domain ids to the LRU, evicting the coldest"""
+        self.domain_ids.update(new_ids)
+        while len(self.domain_ids) > DOMAIN_CACHE_MAX:
+            self.domain_ids.popitem(last=False)
+    
+    def flush_queued(self):
+        """Write whatever the reader has queued so far, without waiting"""
+        while True:
+            try:
+                query = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if query is None:
+                # Leave the stop sentinel for writer_loop; nothing follows it
+                self.queue.put_nowait(None)
+                break
+            self.buffer.append(query)
+        self.flush_buffer()
+    
+    def writer_loop(self):
+        """Writer thread: batch queued queries into the database
+        
+        A batch is written once it reaches BATCH_SIZE or BATCH_INTERVAL
+        seconds after it started, so SD card writes overlap log parsing
+        instead of stalling it. A None in the queue stops the thread after
+        the final flush.
+        """
+        while True:
+            deadline = time.time() + BATCH_INTERVAL
+            stopping = False
+            
+            while len(self.buffer) < BATCH_SIZE:
+                try:
+                    query = self.queue.get(timeout=max(0, deadline - time.time()))
+                except queue.Empty:
+                    break
+                if query is None:
+                    stopping = True
+                    break
+                self.buffer.append(query)
+            
+            # An unexpected error must not kill the thread: the reader would
+            # then block on the full queue forever
+            try:
+                if stopping and (self.buffer or self.pending_rows):
+                    print(f"💾 Flushing {len(self.buffer) + len(self.pending_rows)} buffered queries...")
+                if self.buffer or self.pending_rows:
+                    self.flush_buffer()
+                
+                # Cleanup shares the write connection, so it runs on this thread
+                if not stopping and time.time() - self.last_maintenance >= MAINTENANCE_INTERVAL:
+                    self.run_maintenance()
+            except Exception as e:
+                print(f"❌ Writer error: {e}")
+            if stopping:
+                return
     
     def cleanup_old_data(self):
-        """Remove old logs to save space (runs on startup)"""
+        """Remove old logs to save space (runs on startup and daily)"""
         try:
             cursor = self.conn.cursor()
             cutoff = int(time.time()) - (RETENTION_DAYS * 86400)
-            cursor.execute("DELETE FROM dns_queries WHERE timestamp < ?", (cutoff,))
-            deleted = cursor.rowcount
+            
+            # Delete in small transactions; this thread is the only writer,
+            # so queued log lines are written between chunks and the reader
+            # never waits on a full queue for the whole cleanup
+            deleted = 0
+            while True:
+                cursor.execute("""
+                    DELETE FROM dns_queries WHERE rowid IN (
+                        SELECT rowid FROM dns_queries WHERE timestamp < ? LIMIT ?
+                    )
+                """, (cutoff, CLEANUP_CHUNK))
+                count = cursor.rowcount
+                self.conn.commit()
+                deleted += count
+                if count < CLEANUP_CHUNK:
+                    break
+                self.flush_queued()
+            
+            if deleted > 0:
+                # Drop domain names no remaining query refers to
+                cursor.execute("DELETE FROM domains WHERE id NOT IN "
+                               "(SELECT domain_id FROM dns_queries)")
+                self.domain_ids.clear()
             self.conn.commit()
             
             if deleted > 0:
-                cursor.execute("VACUUM")  # Reclaim space
+                # Return a bounded number of free pages instead of rewriting
+                # the whole file; executescript steps the pragma to completion
+                self.conn.executescript(f"PRAGMA incremental_vacuum({VACUUM_PAGES});")
+                cursor.execute("PRAGMA wal_checkpoint(TRUNCATE)")
                 print(f"🗑️  Cleaned up {deleted} old records")
         except Exception as e:
             print(f"⚠️  Cleanup error: {e}")
     
+    def run_maintenance(self):
+        """Daily cleanup and query planner statistics refresh"""
+        self.cleanup_old_data()
+        try:
+            self.conn.execute("PRAGMA optimize")
+        except sqlite3.Error as e:
+            print(f"⚠️  Optimize error: {e}")
+        self.last_maintenance = time.time()
+    
+    def process_line(self, line):
+        """Parse one log line and hand it to the writer thread"""
+        query = self.parse_query(line)
+        if query:
+            self.enqueue(query)
+    
+    def enqueue(self, item):
+        """Queue an item for the writer thread; returns False if it has died"""
+        while self.writer.is_alive():
+            try:
+                self.queue.put(item, timeout=POLL_INTERVAL)
+                return True
+            except queue.Full:
+                continue
+        
+        if self.running:
+            print("❌ Database writer stopped - exiting")
+            self.running = False
+        return False
+    
+    def watch_log(self):
+        """Watch the log with inotify, or return None to fall back to polling"""
+        if inotify_simple is None:
+            print(f"💡 inotify_simple not installed - polling every {POLL_INTERVAL}s")
+            return None
+        
+        inotify = inotify_simple.INotify()
+        self.log_wd = inotify.add_watch(self.log_path, LOG_WATCH_FLAGS)
+        return inotify
+    
+    def wait_for_log(self, inotify):
+        """Sleep until the log is written to; returns True if it was rotated"""
+        if inotify is None:
+            time.sleep(POLL_INTERVAL)
+            return False
+        
+        # Capped so a quiet log still lets the loop check self.running
+        events = inotify.read(timeout=BATCH_INTERVAL * 1000)
+        rotated = inotify_simple.flags.MOVE_SELF | inotify_simple.flags.DELETE_SELF
+        # Only the followed file counts; a lingering watch on an older file
+        # reports its compression or deletion too
+        return any(event.mask & rotated and event.wd == self.log_wd
+                   for event in events)
+    
+    def read_new_lines(self, f, offset):
+        """Process complete lines written past offset; returns the new offset"""
+        fd = f.fileno()
+        while True:
+            size = os.fstat(fd).st_size
+            if size < offset:
+                # Truncated in place (logrotate copytruncate)
+                offset = 0
+            if size == offset:
+                return offset
+            
+            # pread rather than mmap: a truncate racing this read only makes
+            # it short, where touching unmapped pages would raise SIGBUS
+            data = os.pread(fd, min(size - offset, READ_CHUNK), offset)
+            if not data:
+                continue  # Truncated since fstat
+            
+            last = data.rfind(b'\n')
+            if last == -1:
+                if len(data) < READ_CHUNK:
+                    # A trailing partial line waits until its newline is written
+                    return offset
+                # No newline in a whole window (e.g. NULs left by a power
+                # cut): skip it rather than rereading it forever
+                print(f"⚠️  Skipped {len(data)} bytes without a newline")
+                offset += len(data)
+                continue
+            
+            for line in data[:last].decode('utf-8', 'replace').split('\n'):
+                self.process_line(line)
+            offset += last + 1
+    
+    def reopen_log(self, old, offset, inotify):
+        """Switch to the log file that replaced a rotated one and watch it
+        
+        Returns the file to follow and the offset to continue from.
+        """
+        while True:
+            # The old file can still be written until the new one appears
+            offset = self.read_new_lines(old, offset)
+            try:
+                f = open(self.log_path, 'rb')
+            except FileNotFoundError:
+                # Not recreated yet
+                time.sleep(POLL_INTERVAL)
+                continue
+            
+            if os.fstat(f.fileno()).st_ino == os.fstat(old.fileno()).st_ino:
+                # Same file as before - nothing was rotated
+                f.close()
+                return old, offset
+            
+            self.read_new_lines(old, offset)
+            old.close()
+            try:
+                inotify.rm_watch(self.log_wd)
+            except OSError:
+                pass  # Already gone: the kernel drops watches on deleted files
+            self.log_wd = inotify.add_watch(self.log_path, LOG_WATCH_FLAGS)
+            print("🔄 Log rotated - following new file")
+            return f, 0
+    
     def monitor_log(self):
         """Tail log file with minimal CPU usage"""
         print("=" * 60)
@@ -223,29 +672,31 @@ class OptimizedDNSParser:
         self.cleanup_old_data()
         
         try:
-            with open(self.log_path, 'r') as f:
-                # Start from end of file
-                f.seek(0, 2)
-                print("✅ Monitoring started...\n")
-                
+            f = open(self.log_path, 'rb')
+            # Start from end of file
+            offset = os.fstat(f.fileno()).st_size
+            inotify = self.watch_log()
+            
+            self.writer = threading.Thread(target=self.writer_loop,
+                                           name='db-writer', daemon=True)
+            self.writer.start()
+            print("✅ Monitoring started...\n")
+            
+            try:
                 while self.running:
-                    line = f.readline()
+                    offset = self.read_new_lines(f, offset)
+                    if not self.running:
+                        break  # The writer thread died
                     
-                    if line:
-                        query = self.parse_query(line)
-                        if query:
-                            self.buffer.append(query)
-                            
-                            # Flush if needed
-                            if self.should_flush():
-                                self.flush_buffer()
-                    else:
-                        # No new data - check if time-based flush needed
-                        if self.should_flush() and self.buffer:
-                            self.flush_buffer()
-                        
-                        # Sleep to reduce CPU usage
-                        time.sleep(POLL_INTERVAL)
+                    # Block until the log changes to avoid busy polling
+                    if self.wait_for_log(inotify):
+                        # Rotated: finish the old file, then follow the new one
+                        f, offset = self.reopen_log(f, offset, inotify)
+            finally:
+                f.close()
+                if inotify is not None:
+                    inotify.close()
+                self.close()
                         
         except FileNotFoundError:
             print(f"❌ Log file not found: {self.log_path}")
@@ -253,7 +704,6 @@ class OptimizedDNSParser:
             sys.exit(1)
         except Exception as e:
             print(f"❌ Error: {e}")
-            self.shutdown(None, None)
 
 def main():
     """Entry point"""
@@ -0,0 +1,27 @@
+#!/usr/bin/env python3
+"""
+WSGI entry point for the Pi Zero 2W dashboard
+Serve with a single pre-forked gunicorn worker:
+
+    gunicorn -w 1 -k gthread --threads 2 -b 0.0.0.0:5000 --preload wsgi:app
+
+The SQLite connection opens on the first request, inside the worker, so
+--preload never shares it across a fork.
+"""
+
+try:
+    from dashboard_pizero import app, DB_PATH, CACHE_TIMEOUT, MAX_RECENT_QUERIES
+except ModuleNotFoundError as e:
+    # Installed copies are renamed to dashboard.py (see INSTALL_PIZERO.md);
+    # anything else missing (e.g. Flask) is a real error
+    if e.name != 'dashboard_pizero':
+        raise
+    from dashboard import app, DB_PATH, CACHE_TIMEOUT, MAX_RECENT_QUERIES
+
+print("=" * 60)
+print("🚀 Pi-hole Dashboard - Pi Zero 2W Edition")
+print("=" * 60)
+print(f"💾 Database: {DB_PATH}")
+print(f"⚡ Cache: {CACHE_TIMEOUT}s TTL")
+print(f"📊 Recent queries: {MAX_RECENT_QUERIES}")
+print("=" * 60)